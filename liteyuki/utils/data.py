@@ -1,8 +1,16 @@
+import asyncio
 import os
 import pickle
+import queue
+import re
 import sqlite3
-from types import NoneType
-from typing import Any
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from types import NoneType, UnionType
+from typing import Any, Callable, ClassVar, Iterator, NamedTuple, Union, get_args, get_origin
 
 import nonebot
 import pydantic
@@ -12,6 +20,9 @@ from pydantic import BaseModel
 class LiteModel(BaseModel):
     TABLE_NAME: str = None
     id: int = None
+    # 需要建立索引的字段组合，迁移时自动创建，如 [("user_id",), ("group_id", "user_id")]
+    __indexes__: ClassVar[list[tuple[str, ...]]] = []
+
     def dump(self, *args, **kwargs):
         if pydantic.__version__ < "1.8.2":
             return self.dict(*args, **kwargs)
@@ -19,15 +30,266 @@ class LiteModel(BaseModel):
             return self.model_dump(*args, **kwargs)
 
 
+class ForeignKey(NamedTuple):
+    """读取时外键的占位，批量查询后替换为外键数据"""
+    table_name: str
+    id: int
+
+
+class ConnectionPool:
+    """SQLite连接池
+    WAL模式下允许多个读连接与唯一的写连接并发，连接长期保持以复用页缓存
+    内存数据库或非WAL模式下所有操作共用写连接
+    """
+
+    def __init__(self, db_name: str, size: int = 4, pragmas: str = "", **kwargs):
+        """
+        Args:
+            db_name: 数据库文件路径
+            size: 读连接数量上限
+            pragmas: 每个连接建立后执行的PRAGMA语句
+            **kwargs: 传递给sqlite3.connect的参数
+        """
+        self.db_name = db_name
+        self.size = size
+        self.pragmas = pragmas
+        self.kwargs = kwargs
+
+        self.writer_conn = self._connect()
+        # 写连接唯一的游标，只能在持有写锁时使用
+        self.writer_cursor = self.writer_conn.cursor()
+        self._writer_lock = threading.RLock()
+        # 内存数据库的每个连接相互独立，非WAL模式下读事务会阻塞写入，此时读取也使用写连接
+        journal_mode = self.writer_conn.execute("PRAGMA journal_mode").fetchone()[0]
+        self.shared = db_name in ("", ":memory:") or journal_mode.lower() != "wal"
+
+        self._readers: queue.LifoQueue[sqlite3.Connection] = queue.LifoQueue()
+        self._readers_created = 0
+        self._readers_lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_name, check_same_thread=False, **self.kwargs)
+        if self.pragmas:
+            conn.executescript(self.pragmas)
+        return conn
+
+    @contextmanager
+    def reader(self) -> Iterator[sqlite3.Connection]:
+        """获取读连接，连接不足时按需创建，达到上限后等待归还"""
+        if self.shared:
+            # 共用写连接，读取期间持有写锁
+            with self._writer_lock:
+                yield self.writer_conn
+            return
+        try:
+            conn = self._readers.get_nowait()
+        except queue.Empty:
+            with self._readers_lock:
+                create = self._readers_created < self.size
+                if create:
+                    self._readers_created += 1
+            if create:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    # 创建失败时归还名额，否则达到上限后读取会一直等待
+                    with self._readers_lock:
+                        self._readers_created -= 1
+                    raise
+            else:
+                conn = self._readers.get()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._readers.put(conn)
+
+    @contextmanager
+    def writer(self) -> Iterator[sqlite3.Connection]:
+        """获取写连接，同一时间只有一个线程可以写入"""
+        with self._writer_lock:
+            yield self.writer_conn
+
+    def close(self):
+        """关闭所有连接"""
+        with self._writer_lock:
+            self.writer_conn.close()
+        while True:
+            try:
+                self._readers.get_nowait().close()
+            except queue.Empty:
+                break
+
+
 class Database:
-    def __init__(self, db_name: str):
+    def __init__(
+            self,
+            db_name: str,
+            journal_mode: str = "WAL",
+            synchronous: str = "NORMAL",
+            cache_size: int = -65536,
+            mmap_size: int = 268435456,
+            busy_timeout: int = 5000,
+            cached_statements: int = 256,
+            pool_size: int = 4,
+            flush_interval_ms: int = 0,
+    ):
+        """
+        Args:
+            db_name: 数据库文件路径
+            journal_mode: 日志模式，默认WAL
+            synchronous: 同步级别，WAL下NORMAL即可保证一致性
+            cache_size: 页缓存大小，负数表示KiB，默认64MiB
+            mmap_size: 内存映射大小，默认256MiB
+            busy_timeout: 锁等待超时，单位毫秒
+            cached_statements: 预编译语句缓存数量
+            pool_size: 读连接数量上限
+            flush_interval_ms: 延迟提交间隔，单位毫秒，大于0时该时间内的写操作合并为一次提交，默认0即每次写操作立即提交
+        """
 
         if os.path.dirname(db_name) != "" and not os.path.exists(os.path.dirname(db_name)):
             os.makedirs(os.path.dirname(db_name))
 
         self.db_name = db_name
-        self.conn = sqlite3.connect(db_name)
-        self.cursor = self.conn.cursor()
+        # 每个连接都需要设置的PRAGMA，journal_mode会持久化到数据库文件中
+        # 外键列的REFERENCES仅用于记录引用的表，不启用约束，删除被引用的数据时引用处读取为None
+        pragmas = (
+            f"PRAGMA journal_mode={journal_mode};"
+            f"PRAGMA synchronous={synchronous};"
+            f"PRAGMA temp_store=MEMORY;"
+            f"PRAGMA cache_size={int(cache_size)};"
+            f"PRAGMA mmap_size={int(mmap_size)};"
+            f"PRAGMA busy_timeout={int(busy_timeout)};"
+            f"PRAGMA foreign_keys=OFF;"
+        )
+        self.pool = ConnectionPool(db_name, size=pool_size, pragmas=pragmas, cached_statements=cached_statements)
+        # 异步接口使用的线程池，写线程只有一个以保证SQLite单写入者
+        self._writer_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="liteyuki-db-writer")
+        self._reader_executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="liteyuki-db-reader")
+        # 延迟提交间隔(秒)及等待提交的定时器
+        self.flush_interval = max(flush_interval_ms, 0) / 1000
+        self._flush_timer: threading.Timer | None = None
+        self._closed = False
+
+        with self.pool.writer() as conn:
+            self.journal_mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+        if self.journal_mode.upper() != journal_mode.upper() and db_name not in ("", ":memory:"):
+            nonebot.logger.warning(f"数据库 {db_name} 无法切换到 {journal_mode} 日志模式，当前为 {self.journal_mode}，读写将共用同一连接")
+
+        # 已确认存在的表
+        self._table_exists: set[str] = set()
+        # 表名 -> 表结构(字段 -> 类型)
+        self._table_structure: dict[str, dict[str, str]] = {}
+        # 模型类 -> (模型存储结构(字段 -> 类型), 外键列 -> 引用的表名)
+        self._model_schema: dict[type, tuple[dict[str, str], dict[str, str]]] = {}
+        # 表名 -> 外键列 -> 引用的表名
+        self._foreign_tables: dict[str, dict[str, str]] = {}
+        # (表名, 列名) -> 各列解析方式
+        self._table_columns: dict[tuple[str, tuple[str, ...]], list[tuple[str, str, str | None]]] = {}
+        # 模型类 -> 构造方法
+        self._model_constructors: dict[type, Callable[..., LiteModel]] = {}
+        # (表名, 字段) -> 各字段编码方式
+        self._model_encoders: dict[tuple[str, tuple[str, ...]], list[tuple[str, str, type, Callable[[Any], Any] | None]]] = {}
+        # 类型 -> 解析方法
+        self._loaders: dict[type, Callable[[Any, list[tuple[dict | list, Any, ForeignKey]], deque], Any]] = {
+                dict : self._load_dict,
+                list : self._load_sequence,
+                set  : self._load_sequence,
+                tuple: self._load_sequence,
+        }
+        # (表名, 字段, 行数) -> 增/改语句
+        self._upsert_sql: dict[tuple[str, tuple[str, ...], int], str] = {}
+        # (表名, id数量) -> 外键批量查询语句
+        self._select_in_sql: dict[tuple[str, int], str] = {}
+
+    def close(self):
+        """等待尚未完成的异步操作，提交尚未提交的写操作并关闭数据库的所有连接"""
+        # 先关闭线程池，排队中的异步写操作完成后才会提交，不会在关闭后再开启事务
+        self._writer_executor.shutdown()
+        self._reader_executor.shutdown()
+        with self.pool.writer():
+            self.flush()
+            self._closed = True
+        self.pool.close()
+
+    def flush(self):
+        """立即提交延迟提交模式下尚未提交的写操作"""
+        with self.pool.writer() as conn:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            # 关闭后触发的定时器不再操作已关闭的连接
+            if self._closed:
+                return
+            if conn.in_transaction:
+                conn.commit()
+
+    def _schedule_flush(self):
+        """延迟提交模式下安排一次提交，调用时已持有写锁"""
+        if self._flush_timer is None:
+            self._flush_timer = threading.Timer(self.flush_interval, self.flush)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+
+    @contextmanager
+    def _write_transaction(self) -> Iterator[sqlite3.Connection]:
+        """持有写锁执行一次写操作
+        立即提交模式下成功则提交，出错则回滚；
+        延迟提交模式下在保存点中执行，出错只回滚本次操作，之前等待提交的写操作不受影响
+        """
+        with self.pool.writer() as conn:
+            if not self.flush_interval:
+                try:
+                    yield conn
+                    conn.commit()
+                except Exception:
+                    # 提交失败时同样回滚，避免未提交的数据混入下一次写操作
+                    conn.rollback()
+                    raise
+                return
+            if not conn.in_transaction:
+                conn.execute("BEGIN")
+            conn.execute("SAVEPOINT liteyuki_write")
+            try:
+                yield conn
+            except Exception:
+                # 磁盘已满、I/O错误等情况下SQLite会回滚整个事务，此时保存点已不存在
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK TO liteyuki_write")
+                    conn.execute("RELEASE liteyuki_write")
+                raise
+            else:
+                conn.execute("RELEASE liteyuki_write")
+            finally:
+                self._schedule_flush()
+
+    async def _run_in_executor(self, executor: ThreadPoolExecutor, func: Callable, *args: Any, **kwargs: Any) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(executor, partial(func, *args, **kwargs))
+
+    async def first_async(self, model: LiteModel, condition: str = "", *args: Any, default: Any = None) -> LiteModel | Any | None:
+        """异步查询第一个，在读线程池中执行，不阻塞事件循环，参数同first"""
+        return await self._run_in_executor(self._reader_executor, self.first, model, condition, *args, default=default)
+
+    async def first_by_async(self, model: LiteModel, default: Any = None, **filters: Any) -> LiteModel | Any | None:
+        """异步按字段相等条件查询第一个，参数同first_by"""
+        return await self._run_in_executor(self._reader_executor, self.first_by, model, default=default, **filters)
+
+    async def all_async(self, model: LiteModel, condition: str = "", *args: Any, default: Any = None) -> list[LiteModel | Any] | None:
+        """异步查询所有，在读线程池中执行，不阻塞事件循环，参数同all"""
+        return await self._run_in_executor(self._reader_executor, self.all, model, condition, *args, default=default)
+
+    async def upsert_async(self, *args: LiteModel):
+        """异步增/改操作，在唯一的写线程中执行，参数同upsert"""
+        return await self._run_in_executor(self._writer_executor, self.upsert, *args)
+
+    async def delete_async(self, model: LiteModel, condition: str, *args: Any, allow_empty: bool = False):
+        """异步删除满足条件的数据，在唯一的写线程中执行，参数同delete"""
+        return await self._run_in_executor(self._writer_executor, self.delete, model, condition, *args, allow_empty=allow_empty)
+
+    async def flush_async(self):
+        """异步提交尚未提交的写操作，参数同flush"""
+        return await self._run_in_executor(self._writer_executor, self.flush)
 
     def first(self, model: LiteModel, condition: str = "", *args: Any, default: Any = None) -> LiteModel | Any | None:
         """查询第一个
@@ -40,8 +302,29 @@ class Database:
         Returns:
 
         """
-        all_results = self.all(model, condition, *args)
-        return all_results[0] if all_results else default
+        return next(self.iter_all(model, condition, *args, batch_size=1), default)
+
+    def first_by(self, model: LiteModel, default: Any = None, **filters: Any) -> LiteModel | Any | None:
+        """按字段相等条件查询第一个，可配合__indexes__使用索引
+        Args:
+            model: 数据模型实例
+            default: 默认值
+            **filters: 字段名=值，外键字段可传入模型或id
+
+        Returns:
+
+        """
+        conditions, args = [], []
+        for field, value in filters.items():
+            stored_field = self._get_stored_field(model.TABLE_NAME, field)
+            if isinstance(value, LiteModel):
+                with self.pool.reader() as conn:
+                    foreign_tables = self._get_foreign_tables(conn, model.TABLE_NAME)
+                # 没有REFERENCES的旧外键列以字符串形式记录
+                value = value.id if stored_field in foreign_tables else f"{self.FOREIGN_KEY_PREFIX}{value.id}@{value.TABLE_NAME}"
+            conditions.append(f"{stored_field} = ?")
+            args.append(value)
+        return self.first(model, " AND ".join(conditions), *args, default=default)
 
     def all(self, model: LiteModel, condition: str = "", *args: Any, default: Any = None) -> list[LiteModel | Any] | None:
         """查询所有
@@ -53,140 +336,604 @@ class Database:
 
         Returns:
 
+        """
+        results = list(self.iter_all(model, condition, *args))
+        return results if results else default
+
+    def iter_all(self, model: LiteModel, condition: str = "", *args: Any, batch_size: int = None) -> Iterator[LiteModel | Any]:
+        """逐批查询所有，以生成器形式返回，不会一次性将整张表读入内存
+        Args:
+            model: 数据模型实例
+            condition: 查询条件，不给定则查询所有
+            *args: 参数化查询参数
+            batch_size: 每批读取的行数，外键按批合并查询
+
+        Returns:
+
         """
         table_name = model.TABLE_NAME
         model_type = type(model)
         if not table_name:
             raise ValueError(f"数据模型{model_type.__name__}未提供表名")
+        check_sqlite_identifier(table_name)
+        batch_size = batch_size or self.ITER_BATCH_SIZE
+        constructor = self._get_model_constructor(model_type, table_name)
+        # 延迟提交模式下先提交之前的写操作，保证能读到
+        if self._flush_timer is not None:
+            self.flush()
 
-        # condition = f"WHERE {condition}"
-        # print(f"SELECT * FROM {table_name} {condition}", args)
-        # if len(args) == 0:
-        #     results = self.cursor.execute(f"SELECT * FROM {table_name} {condition}").fetchall()
-        # else:
-        #     results = self.cursor.execute(f"SELECT * FROM {table_name} {condition}", args).fetchall()
-        if condition:
-            results = self.cursor.execute(f"SELECT * FROM {table_name} WHERE {condition}", args).fetchall()
-        else:
-            results = self.cursor.execute(f"SELECT * FROM {table_name}").fetchall()
-        fields = [description[0] for description in self.cursor.description]
-        if not results:
-            return default
-        else:
-            return [model_type(**self._load(dict(zip(fields, result)))) for result in results]
+        # 迭代期间独占一个读连接，不受其他操作影响
+        with self.pool.reader() as conn:
+            if condition:
+                cursor = conn.execute(f"SELECT * FROM {table_name} WHERE {condition}", args)
+            else:
+                cursor = conn.execute(f"SELECT * FROM {table_name}")
+            try:
+                fields = [description[0] for description in cursor.description]
+                while results := cursor.fetchmany(batch_size):
+                    for row in self._load_rows(conn, table_name, fields, results):
+                        yield constructor(**row)
+            finally:
+                cursor.close()
+
+    def _get_model_constructor(self, model_type: type[LiteModel], table_name: str) -> Callable[..., LiteModel]:
+        """获取从数据库数据构造模型的方法
+        数据库中的数据在写入时已校验过，若所有字段读出后类型不变，则跳过校验直接构造
+        字段类型变化后迁移会保留原有的列和数据，因此按表中实际的列类型判断
+        Args:
+            model_type: 模型类
+            table_name: 表名
+
+        Returns:
+            构造方法
+        """
+        constructor = self._model_constructors.get(model_type)
+        if constructor is None:
+            constructor = model_type
+            model_schema = self._model_schema.get(model_type)
+            structure = self._table_structure.get(table_name)
+            # 只有本实例迁移过的表才能确定列与模型字段一一对应
+            if model_schema is not None and structure is not None and structure.keys() - {"id"} == model_schema[0].keys() \
+                    and self._is_trusted_model(model_type, structure):
+                constructor = self._get_trusted_constructor(model_type, structure)
+            self._model_constructors[model_type] = constructor
+        return constructor
+
+    def _get_trusted_constructor(self, model_type: type[LiteModel], structure: dict[str, str]) -> Callable[..., LiteModel]:
+        """获取跳过校验的构造方法
+        序列化的容器列无法从列类型得知旧数据的类型，逐行检查最外层类型，与字段不符时回退到校验
+        Args:
+            model_type: 模型类
+            structure: 表结构(列名 -> 实际的列类型)
+
+        Returns:
+            构造方法
+        """
+        construct = getattr(model_type, "model_construct", None) or model_type.construct
+        # [(字段, 允许的最外层类型)]
+        checks: list[tuple[str, frozenset[type]]] = []
+        fields = getattr(model_type, "model_fields", None) or model_type.__fields__
+        for name, field in fields.items():
+            alias = field.alias or name
+            if self.BYTES_PREFIX + alias in structure:
+                types = self._get_origin_types(field.annotation)
+                if types is not None:
+                    checks.append((alias, types))
+        if not checks:
+            return construct
+
+        def constructor(**data: Any) -> LiteModel:
+            for alias, types in checks:
+                if type(data[alias]) not in types:
+                    return model_type(**data)
+            return construct(**data)
+
+        return constructor
+
+    def _get_origin_types(self, annotation: Any) -> frozenset[type] | None:
+        """获取字段允许的最外层类型，不限类型时返回None"""
+        if annotation is Any:
+            return None
+        origin = get_origin(annotation)
+        if origin in (Union, UnionType):
+            types = set()
+            for arg in get_args(annotation):
+                arg_types = self._get_origin_types(arg)
+                if arg_types is None:
+                    return None
+                types |= arg_types
+            return frozenset(types)
+        return frozenset((origin or annotation,))
+
+    def _is_trusted_model(self, model_type: type[LiteModel], structure: dict[str, str]) -> bool:
+        """检查模型所有字段读出后是否与写入时类型一致
+        Args:
+            model_type: 模型类
+            structure: 表结构(列名 -> 实际的列类型)
+
+        Returns:
+            是否可跳过校验
+        """
+        fields = getattr(model_type, "model_fields", None) or model_type.__fields__
+        for name, field in fields.items():
+            if name in ["TABLE_NAME", "id"]:
+                continue
+            alias = field.alias or name
+            if self.BYTES_PREFIX + alias in structure:
+                # 容器整体序列化，除元组和集合会被读取为列表外，类型保持不变，但元素类型无法从列类型得知
+                if not self._is_trusted_type(field.annotation, self.TRUSTED_CONTAINER_TYPES):
+                    return False
+            elif alias in structure:
+                # SQLite按列类型亲和性转换数据，列类型需要与字段类型对应
+                if not self._is_trusted_type(field.annotation, self.TRUSTED_COLUMN_TYPES.get(structure[alias].upper(), ())):
+                    return False
+            else:
+                # 外键需要转换为模型
+                return False
+        return True
+
+    def _is_trusted_type(self, annotation: Any, trusted_types: tuple[type, ...]) -> bool:
+        if annotation is Any or annotation is NoneType:
+            return True
+        origin = get_origin(annotation)
+        if origin is None:
+            return annotation in trusted_types
+        args = get_args(annotation)
+        if origin in (Union, UnionType):
+            # Optional/Union，检查每个分支
+            return all(self._is_trusted_type(arg, trusted_types) for arg in args)
+        if origin not in (dict, list) or origin not in trusted_types:
+            return False
+        # 迁移会保留容器中字段类型变化前的旧数据，只有元素类型不受限时才可跳过校验
+        return all(arg is Any for arg in args)
 
     def upsert(self, *args: LiteModel):
         """增/改操作
+        同一表且字段相同的模型会合并为一次executemany，整个操作只提交一次，延迟提交模式下与其他写操作合并提交
         Args:
             *args:
 
         Returns:
         """
-        table_list = [item[0] for item in self.cursor.execute("SELECT name FROM sqlite_master WHERE type='table'").fetchall()]
+        # (表名, 字段) -> 行数据列表
+        batches: dict[tuple[str, tuple[str, ...]], list[tuple]] = {}
         for model in args:
             if not model.TABLE_NAME:
                 raise ValueError(f"数据模型 {model.__class__.__name__} 未提供表名")
-            elif model.TABLE_NAME not in table_list:
+            elif not self._detect_for_table(model.TABLE_NAME):
                 raise ValueError(f"数据模型 {model.__class__.__name__} 表 {model.TABLE_NAME} 不存在，请先迁移")
+        with self._write_transaction():
+            for model in args:
+                table_name, fields, values = self._get_row(model.dump(by_alias=True))
+                batches.setdefault((table_name, fields), []).append(values)
+            for (table_name, fields), rows in batches.items():
+                self._execute_upsert(table_name, fields, rows)
+
+    def _execute_upsert(self, table_name: str, fields: tuple[str, ...], rows: list[tuple]):
+        """写入同一表且字段相同的多行数据，调用时已持有写锁
+        行数较多时合并为多行VALUES语句，每条语句的参数数量不超过上限
+        Args:
+            table_name: 表名
+            fields: 字段列表
+            rows: 行数据列表
+        """
+        cursor = self.pool.writer_cursor
+        if len(rows) <= self.MULTI_ROW_THRESHOLD or not fields:
+            cursor.executemany(self._get_upsert_sql(table_name, fields), rows)
+            return
+        chunk_size = max(1, self.MAX_QUERY_PARAMS // len(fields))
+        for i in range(0, len(rows), chunk_size):
+            chunk = rows[i:i + chunk_size]
+            cursor.execute(self._get_upsert_sql(table_name, fields, len(chunk)), [value for row in chunk for value in row])
+
+    def _get_upsert_sql(self, table_name: str, fields: tuple[str, ...], row_count: int = 1) -> str:
+        """生成增/改语句，id冲突时原地更新而非删除后重新插入
+        Args:
+            table_name: 表名
+            fields: 字段列表
+            row_count: 单条语句写入的行数
+
+        Returns:
+            SQL语句
+        """
+        sql = self._upsert_sql.get((table_name, fields, row_count))
+        if sql is None:
+            columns = ', '.join([f'"{field}"' for field in fields])
+            placeholders = ', '.join([f"({', '.join('?' for _ in fields)})"] * row_count)
+            sql = f"INSERT INTO {table_name}({columns}) VALUES {placeholders}"
+            if "id" in fields:
+                updates = ', '.join([f'"{field}" = excluded."{field}"' for field in fields if field != "id"])
+                sql += f" ON CONFLICT(id) DO UPDATE SET {updates}" if updates else " ON CONFLICT(id) DO NOTHING"
+            self._upsert_sql[(table_name, fields, row_count)] = sql
+        return sql
+
+    def _detect_for_table(self, table_name: str) -> bool:
+        """检测表是否存在，结果会被缓存
+        Args:
+            table_name: 表名
+
+        Returns:
+            是否存在
+        """
+        if table_name in self._table_exists:
+            return True
+        with self.pool.reader() as conn:
+            exists = conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name = ?", (table_name,)).fetchone()
+        if exists:
+            self._table_exists.add(table_name)
+            return True
+        return False
+
+    def _get_row(self, obj: dict) -> tuple[str, tuple[str, ...], tuple]:
+        """将模型字典转换为一行数据，嵌套的模型会先行写入但不提交
+        Args:
+            obj: 模型字典
+
+        Returns:
+            表名, 字段, 值
+        """
+        table_name = obj.get("TABLE_NAME")
+        row_id = obj.get("id")
+        fields, values = [], []
+        for field, stored_field, value_type, encoder in self._get_encoders(obj):
+            value = obj[field]
+            if type(value) is not value_type:
+                # 与首次记录的类型不同，按值重新选择编码方式
+                stored_field, encoder = check_sqlite_identifier(self._get_stored_field_prefix(value) + field), self._get_encoder(table_name, field, value)
+            fields.append(stored_field)
+            values.append(value if encoder is None else encoder(value))
+        if row_id is not None:
+            # 如果 _id 不为空，将 'id' 插入到字段列表的开始
+            fields.insert(0, 'id')
+            # 将 _id 插入到值列表的开始
+            values.insert(0, row_id)
+        return table_name, tuple(fields), tuple(values)
+
+    def _get_encoders(self, obj: dict) -> list[tuple[str, str, type, Callable[[Any], Any] | None]]:
+        """获取模型各字段的编码方式，按表名和字段缓存，同一张表可对应多个字段不同的模型
+        Args:
+            obj: 模型字典
+
+        Returns:
+            [(字段, 存储字段, 值类型, 编码方法)]，编码方法为None时直接存储
+        """
+        table_name = obj.get("TABLE_NAME")
+        key = (table_name, tuple(obj))
+        encoders = self._model_encoders.get(key)
+        if encoders is None:
+            check_sqlite_identifier(table_name)
+            encoders = []
+            # 移除TABLE_NAME和id
+            for field, value in obj.items():
+                if field not in ["TABLE_NAME", "id"]:
+                    stored_field = check_sqlite_identifier(self._get_stored_field_prefix(value) + field)
+                    encoders.append((field, stored_field, type(value), self._get_encoder(table_name, field, value)))
+            self._model_encoders[key] = encoders
+        return encoders
+
+    def _get_encoder(self, table_name: str, field: str, value: Any) -> Callable[[Any], Any] | None:
+        """根据值选择编码方法
+        Args:
+            table_name: 表名
+            field: 字段名
+            value: 值
+
+        Returns:
+            编码方法，基础类型返回None
+        """
+        if isinstance(value, dict):
+            if "TABLE_NAME" not in value:
+                return self._save_dict
+            if self.FOREIGN_KEY_PREFIX + field in self._get_foreign_tables(self.pool.writer_conn, table_name):
+                return self._save_foreign
+            # 旧版本创建的外键列没有REFERENCES，无法得知引用的表，仍以字符串形式记录
+            return self._save_foreign_string
+        elif isinstance(value, (list, set, tuple)):
+            return self._save_sequence
+        elif isinstance(value, self.BASIC_TYPE):
+            return None
+        raise ValueError(f"数据模型{table_name}包含不支持的数据类型，字段：{field} 值：{value} 值类型：{type(value)}")
+
+    def _save_fields(self, obj: dict) -> dict:
+        if all(type(value) in self.BASIC_TYPE_SET for value in obj.values()):
+            # 仅包含基础类型的字典无需逐项处理
+            return obj
+        table_name = obj.get("TABLE_NAME")
+        new_obj = {}
+        for field, value in obj.items():
+            if isinstance(value, self.ITERABLE_TYPE):
+                new_obj[self._get_stored_field_prefix(value) + field] = self._encode(value)
+            elif isinstance(value, self.BASIC_TYPE):
+                new_obj[field] = value
             else:
-                self._save(model.dump(by_alias=True))
+                raise ValueError(f"数据模型{table_name}包含不支持的数据类型，字段：{field} 值：{value} 值类型：{type(value)}")
+        return new_obj
+
+    def _encode(self, obj: Any) -> Any:
+        """编码嵌套数据，嵌套容器保持原有结构，只在最外层序列化一次
+        Args:
+            obj: 嵌套数据
 
-    def _save(self, obj: Any) -> Any:
-        # obj = copy.deepcopy(obj)
+        Returns:
+            外键或编码后的容器
+        """
         if isinstance(obj, dict):
-            table_name = obj.get("TABLE_NAME")
-            row_id = obj.get("id")
-            new_obj = {}
-            for field, value in obj.items():
-                if isinstance(value, self.ITERABLE_TYPE):
-                    new_obj[self._get_stored_field_prefix(value) + field] = self._save(value)  # self._save(value)  # -> bytes
-                elif isinstance(value, self.BASIC_TYPE):
-                    new_obj[field] = value
-                else:
-                    raise ValueError(f"数据模型{table_name}包含不支持的数据类型，字段：{field} 值：{value} 值类型：{type(value)}")
-            if table_name:
-                fields, values = [], []
-                for n_field, n_value in new_obj.items():
-                    if n_field not in ["TABLE_NAME", "id"]:
-                        fields.append(n_field)
-                        values.append(n_value)
-                # 移除TABLE_NAME和id
-                fields = list(fields)
-                values = list(values)
-                if row_id is not None:
-                    # 如果 _id 不为空，将 'id' 插入到字段列表的开始
-                    fields.insert(0, 'id')
-                    # 将 _id 插入到值列表的开始
-                    values.insert(0, row_id)
-                fields = ', '.join([f'"{field}"' for field in fields])
-                placeholders = ', '.join('?' for _ in values)
-                self.cursor.execute(f"INSERT OR REPLACE INTO {table_name}({fields}) VALUES ({placeholders})", tuple(values))
-                self.conn.commit()
-                foreign_id = self.cursor.execute("SELECT last_insert_rowid()").fetchone()[0]
-                return f"{self.FOREIGN_KEY_PREFIX}{foreign_id}@{table_name}"  # -> FOREIGN_KEY_123456@{table_name} id@{table_name}
+            if obj.get("TABLE_NAME"):
+                # 容器内的模型无法使用外键列，仍以字符串形式记录
+                return self._save_foreign_string(obj)
             else:
-                return pickle.dumps(new_obj)  # -> bytes
+                return self._save_fields(obj)
         elif isinstance(obj, (list, set, tuple)):
-            obj_type = type(obj)  # 到时候转回去
-            new_obj = []
-            for item in obj:
-                if isinstance(item, self.ITERABLE_TYPE):
-                    new_obj.append(self._save(item))
-                elif isinstance(item, self.BASIC_TYPE):
-                    new_obj.append(item)
-                else:
-                    raise ValueError(f"数据模型包含不支持的数据类型，值：{item} 值类型：{type(item)}")
-            return pickle.dumps(obj_type(new_obj))  # -> bytes
+            return self._encode_sequence(obj)
         else:
             raise ValueError(f"数据模型包含不支持的数据类型，值：{obj} 值类型：{type(obj)}")
 
-    def _load(self, obj: Any) -> Any:
+    def _save_foreign(self, obj: dict) -> int:
+        """写入外键模型并返回其id，存入外键列
+        外键模型需要先写入以获取id，由外层upsert统一提交，调用时已持有写锁
+        Args:
+            obj: 模型字典
 
-        if isinstance(obj, dict):
+        Returns:
+            外键id
+        """
+        table_name, fields, values = self._get_row(obj)
+        cursor = self.pool.writer_cursor
+        cursor.execute(self._get_upsert_sql(table_name, fields), values)
+        # 冲突更新时不会改变lastrowid，已有id时直接使用
+        foreign_id = obj.get("id")
+        if foreign_id is None:
+            foreign_id = cursor.lastrowid
+        return foreign_id
 
-            new_obj = {}
+    def _save_foreign_string(self, obj: dict) -> str:
+        return f"{self.FOREIGN_KEY_PREFIX}{self._save_foreign(obj)}@{obj['TABLE_NAME']}"  # -> FOREIGN_KEY_123456@{table_name}
 
-            for field, value in obj.items():
+    def _save_dict(self, obj: dict) -> bytes:
+        return pickle.dumps(self._save_fields(obj), self.PICKLE_PROTOCOL)  # -> bytes
 
-                field: str
+    def _save_sequence(self, obj: list | set | tuple) -> bytes:
+        return pickle.dumps(self._encode_sequence(obj), self.PICKLE_PROTOCOL)  # -> bytes
 
-                if field.startswith(self.BYTES_PREFIX):
+    def _encode_sequence(self, obj: list | set | tuple) -> list | set | tuple:
+        if all(type(item) in self.BASIC_TYPE_SET for item in obj):
+            # 仅包含基础类型的列表无需逐项处理
+            return obj
+        obj_type = type(obj)  # 到时候转回去
+        new_obj = []
+        for item in obj:
+            if isinstance(item, self.ITERABLE_TYPE):
+                new_obj.append(self._encode(item))
+            elif isinstance(item, self.BASIC_TYPE):
+                new_obj.append(item)
+            else:
+                raise ValueError(f"数据模型包含不支持的数据类型，值：{item} 值类型：{type(item)}")
+        return obj_type(new_obj)
 
-                    new_obj[field.replace(self.BYTES_PREFIX, "")] = self._load(pickle.loads(value))
+    def _load_rows(self, conn: sqlite3.Connection, table_name: str, fields: list[str], rows: list[tuple]) -> list[dict]:
+        """加载多行数据，外键按表批量查询，查询次数与嵌套深度相关而与外键数量无关
+        Args:
+            conn: 用于查询外键的连接
+            table_name: 表名
+            fields: 列名，即cursor.description中的名称
+            rows: 原始行数据
 
-                elif field.startswith(self.FOREIGN_KEY_PREFIX):
+        Returns:
+            解析后的行数据
+        """
+        slots: list[tuple[dict | list, Any, ForeignKey]] = []
+        columns = self._get_columns(conn, table_name, fields)
+        loaded_rows = [self._load_row(columns, row, slots) for row in rows]
+        # 外键 -> (_get_columns的结果, 原始行数据)
+        foreign_rows: dict[ForeignKey, tuple[list[tuple[str, str, str | None]], tuple] | None] = {}
+        # (父容器, 键或下标, 外键, 引用链上的外键)，逐层替换
+        level = [(parent, key, foreign_key, frozenset()) for parent, key, foreign_key in slots]
+        while level:
+            missing = {foreign_key for _, _, foreign_key, _ in level} - foreign_rows.keys()
+            if missing:
+                foreign_rows.update(self._fetch_foreign_data(conn, missing))
+            next_level = []
+            for parent, key, foreign_key, chain in level:
+                foreign_row = foreign_rows[foreign_key]
+                if foreign_row is None or foreign_key in chain:
+                    # 外键数据不存在或循环引用
+                    parent[key] = None
+                    continue
+                # 每处引用各自解析一份，修改其中一处不会影响其他行
+                slots = []
+                parent[key] = self._load_row(*foreign_row, slots)
+                chain = chain | {foreign_key}
+                next_level.extend((*slot, chain) for slot in slots)
+            level = next_level
+        return loaded_rows
 
-                    new_obj[field.replace(self.FOREIGN_KEY_PREFIX, "")] = self._load(self._get_foreign_data(value))
+    def _get_columns(self, conn: sqlite3.Connection, table_name: str, fields: list[str]) -> list[tuple[str, str, str | None]]:
+        """根据列名计算各列的字段名、存储前缀和外键表，按表和列缓存，查询时无需字符串处理
+        Args:
+            conn: 数据库连接
+            table_name: 表名
+            fields: 列名
 
+        Returns:
+            [(字段名, 存储前缀, 外键表)]
+        """
+        key = (table_name, tuple(fields))
+        columns = self._table_columns.get(key)
+        if columns is None:
+            foreign_tables = self._get_foreign_tables(conn, table_name)
+            columns = []
+            for field in fields:
+                if field.startswith(self.BYTES_PREFIX):
+                    columns.append((field.replace(self.BYTES_PREFIX, ""), self.BYTES_PREFIX, None))
+                elif field.startswith(self.FOREIGN_KEY_PREFIX):
+                    columns.append((field.replace(self.FOREIGN_KEY_PREFIX, ""), self.FOREIGN_KEY_PREFIX, foreign_tables.get(field)))
                 else:
-                    new_obj[field] = value
-            return new_obj
-        elif isinstance(obj, (list, set, tuple)):
+                    columns.append((field, "", None))
+            self._table_columns[key] = columns
+        return columns
 
-            print(" - Load as List")
+    def _get_foreign_tables(self, conn: sqlite3.Connection, table_name: str) -> dict[str, str]:
+        """获取表中外键列所引用的表，迁移时记录，未迁移的表从PRAGMA foreign_key_list中读取
+        Args:
+            conn: 数据库连接
+            table_name: 表名
 
-            new_obj = []
-            for item in obj:
+        Returns:
+            外键列 -> 引用的表名
+        """
+        foreign_tables = self._foreign_tables.get(table_name)
+        if foreign_tables is None:
+            foreign_tables = self._foreign_tables[table_name] = {
+                    column[3]: column[2] for column in conn.execute(f"PRAGMA foreign_key_list({table_name})").fetchall()
+            }
+        return foreign_tables
 
-                print("   - Loading Item", item)
+    def _load_row(self, columns: list[tuple[str, str, str | None]], row: tuple, slots: list[tuple[dict | list, Any, ForeignKey]]) -> dict:
+        """按列解析一行数据，外键替换为ForeignKey并将其位置记录到slots中，等待批量查询后原地替换
+        Args:
+            columns: _get_columns的结果
+            row: 原始行数据
+            slots: 外键位置(父容器, 键或下标, 外键)
 
-                if isinstance(item, bytes):
+        Returns:
+            解析后的行数据
+        """
+        new_obj = {}
+        worklist: deque[tuple[dict | list, Any, Any]] = deque()
+        for (field, prefix, foreign_table), value in zip(columns, row):
+            if prefix == self.BYTES_PREFIX:
+                if isinstance(value, bytes):
+                    value = pickle.loads(value)
+                worklist.append((new_obj, field, value))
+            elif prefix == self.FOREIGN_KEY_PREFIX:
+                if isinstance(value, int) and foreign_table is not None:
+                    value = ForeignKey(foreign_table, value)
+                    slots.append((new_obj, field, value))
+                elif isinstance(value, str):
+                    # 旧版本以字符串形式储存的外键
+                    value = self._parse_foreign_key(value)
+                    slots.append((new_obj, field, value))
+            new_obj[field] = value
+        self._drain(worklist, slots)
+        return new_obj
 
-                    # 对bytes进行尝试解析，解析失败则返回原始bytes
-                    try:
-                        new_obj.append(self._load(pickle.loads(item)))
-                    except Exception as e:
-                        new_obj.append(self._load(item))
+    def _drain(self, worklist: deque, slots: list[tuple[dict | list, Any, ForeignKey]]):
+        """处理工作队列，使用队列代替递归，嵌套再深也不会触发递归上限
+        Args:
+            worklist: (父容器, 键或下标, 值)
+            slots: 外键位置(父容器, 键或下标, 外键)
+        """
+        while worklist:
+            parent, key, value = worklist.popleft()
+            loader = self._loaders.get(type(value))
+            if loader is not None:
+                parent[key] = loader(value, slots, worklist)
 
-                    print("     - Load as Bytes | Result:", new_obj[-1])
+    def _load_dict(self, obj: dict, slots: list[tuple[dict | list, Any, ForeignKey]], worklist: deque) -> dict:
+        new_obj = {}
+        for field, value in obj.items():
 
-                elif isinstance(item, str) and item.startswith(self.FOREIGN_KEY_PREFIX):
-                    new_obj.append(self._load(self._get_foreign_data(item)))
-                else:
-                    new_obj.append(self._load(item))
-            return new_obj
-        else:
-            return obj
+            field: str
+
+            if type(field) is not str or field[:1] not in self.PREFIX_INITIALS:
+                # 绝大多数键不带前缀，只比较首字符即可跳过
+                new_obj[field] = value
+
+            elif field.startswith(self.BYTES_PREFIX):
+
+                # 最外层为序列化后的bytes，嵌套的容器则已是原结构
+                if isinstance(value, bytes):
+                    value = pickle.loads(value)
+                field = field.replace(self.BYTES_PREFIX, "")
+                new_obj[field] = value
+                worklist.append((new_obj, field, value))
+
+            elif field.startswith(self.FOREIGN_KEY_PREFIX):
+
+                field = field[len(self.FOREIGN_KEY_PREFIX):]
+                if isinstance(value, str):
+                    value = self._parse_foreign_key(value)
+                    slots.append((new_obj, field, value))
+                new_obj[field] = value
+
+            else:
+                new_obj[field] = value
+        return new_obj
+
+    def _load_sequence(self, obj: list | set | tuple, slots: list[tuple[dict | list, Any, ForeignKey]], worklist: deque) -> list:
+        new_obj = list(obj)
+        for i, item in enumerate(new_obj):
+
+            if isinstance(item, bytes):
+
+                # 对bytes进行尝试解析，解析失败则返回原始bytes
+                try:
+                    new_obj[i] = pickle.loads(item)
+                except Exception as e:
+                    continue
+                worklist.append((new_obj, i, new_obj[i]))
+
+            elif isinstance(item, str) and item.startswith(self.FOREIGN_KEY_PREFIX):
+                new_obj[i] = self._parse_foreign_key(item)
+                slots.append((new_obj, i, new_obj[i]))
+            else:
+                worklist.append((new_obj, i, item))
+        return new_obj
+
+    def _parse_foreign_key(self, value: str) -> ForeignKey:
+        """解析字符串形式的外键
+        Args:
+            value: 形如 FOREIGN_KEY_{id}@{table_name}
+
+        Returns:
+            ForeignKey
+        """
+        # 已确认前缀，直接切片后只分割一次
+        foreign_id, _, table_name = value[len(self.FOREIGN_KEY_PREFIX):].partition("@")
+        return ForeignKey(table_name, int(foreign_id))
+
+    def _fetch_foreign_data(self, conn: sqlite3.Connection, foreign_keys: set[ForeignKey]) -> dict[ForeignKey, tuple[list[tuple[str, str, str | None]], tuple] | None]:
+        """
+        批量获取外键数据，同一张表的外键合并为 IN 查询
+        Args:
+            conn: 数据库连接
+            foreign_keys: 外键
+
+        Returns:
+            外键 -> (_get_columns的结果, 原始行数据)，不存在时为None
+        """
+        # 表名 -> id列表
+        tables: dict[str, list[int]] = {}
+        for foreign_key in foreign_keys:
+            tables.setdefault(foreign_key.table_name, []).append(foreign_key.id)
+
+        result: dict[ForeignKey, tuple[list[tuple[str, str, str | None]], tuple] | None] = dict.fromkeys(foreign_keys)
+        for table_name, ids in tables.items():
+            for i in range(0, len(ids), self.MAX_QUERY_PARAMS):
+                chunk = ids[i:i + self.MAX_QUERY_PARAMS]
+                cursor = conn.execute(self._get_select_in_sql(table_name, len(chunk)), chunk)
+                rows = cursor.fetchall()
+                fields = [description[0] for description in cursor.description]
+                columns, id_index = self._get_columns(conn, table_name, fields), fields.index("id")
+                for row in rows:
+                    result[ForeignKey(table_name, row[id_index])] = (columns, row)
+        return result
+
+    def _get_select_in_sql(self, table_name: str, count: int) -> str:
+        """获取按id批量查询的语句，表名只在首次生成时校验
+        Args:
+            table_name: 表名
+            count: id数量
+
+        Returns:
+            查询语句
+        """
+        key = (table_name, count)
+        sql = self._select_in_sql.get(key)
+        if sql is None:
+            check_sqlite_identifier(table_name)
+            sql = self._select_in_sql[key] = f"SELECT * FROM {table_name} WHERE id IN ({', '.join('?' * count)})"
+        return sql
 
     def delete(self, model: LiteModel, condition: str, *args: Any, allow_empty: bool = False):
         """
@@ -203,12 +950,16 @@ class Database:
         table_name = model.TABLE_NAME
         if not table_name:
             raise ValueError(f"数据模型{model.__class__.__name__}未提供表名")
+        check_sqlite_identifier(table_name)
         if model.id is not None:
-            condition = f"id = {model.id}"
+            condition, args = "id = ?", (model.id,)
         if not condition and not allow_empty:
             raise ValueError("删除操作必须提供条件")
-        self.cursor.execute(f"DELETE FROM {table_name} WHERE {condition}", args)
-        self.conn.commit()
+        with self._write_transaction() as conn:
+            if condition:
+                conn.execute(f"DELETE FROM {table_name} WHERE {condition}", args)
+            else:
+                conn.execute(f"DELETE FROM {table_name}")
 
     def auto_migrate(self, *args: LiteModel):
 
@@ -220,40 +971,134 @@ class Database:
         Returns:
 
         """
-        for model in args:
-            if not model.TABLE_NAME:
-                raise ValueError(f"数据模型{type(model).__name__}未提供表名")
+        with self.pool.writer() as conn:
+            cursor = self.pool.writer_cursor
+            # 整个迁移在同一事务中完成，避免每条DDL单独提交
+            if conn.in_transaction:
+                conn.commit()
+            cursor.execute("BEGIN")
+            try:
+                for model in args:
+                    if not model.TABLE_NAME:
+                        raise ValueError(f"数据模型{type(model).__name__}未提供表名")
+                    check_sqlite_identifier(model.TABLE_NAME)
 
-            # 若无则创建表
-            self.cursor.execute(
-                f'CREATE TABLE IF NOT EXISTS "{model.TABLE_NAME}" (id INTEGER PRIMARY KEY AUTOINCREMENT)'
-            )
-
-            # 获取表结构,field -> SqliteType
-            new_structure = {}
-            for n_field, n_value in model.dump(by_alias=True).items():
-                if n_field not in ["TABLE_NAME", "id"]:
-                    new_structure[self._get_stored_field_prefix(n_value) + n_field] = self._get_stored_type(n_value)
-
-            # 原有的字段列表
-            existing_structure = dict([(column[1], column[2]) for column in self.cursor.execute(f'PRAGMA table_info({model.TABLE_NAME})').fetchall()])
-            # 检测缺失字段，由于SQLite是动态类型，所以不需要检测类型
-            for n_field, n_type in new_structure.items():
-                if n_field not in existing_structure.keys() and n_field.lower() not in ["id", "table_name"]:
-                    default_value = self.DEFAULT_MAPPING.get(n_type, 'NULL')
-                    self.cursor.execute(
-                        f"ALTER TABLE '{model.TABLE_NAME}' ADD COLUMN {n_field} {n_type} DEFAULT {self.DEFAULT_MAPPING.get(n_type, default_value)}"
+                    # 若无则创建表
+                    cursor.execute(
+                        f'CREATE TABLE IF NOT EXISTS "{model.TABLE_NAME}" (id INTEGER PRIMARY KEY AUTOINCREMENT)'
                     )
 
-            # 检测多余字段进行删除
-            for e_field in existing_structure.keys():
-                if e_field not in new_structure.keys() and e_field.lower() not in ['id']:
-                    self.cursor.execute(
-                        f'ALTER TABLE "{model.TABLE_NAME}" DROP COLUMN "{e_field}"'
-                    )
-        self.conn.commit()
+                    # 模型可能已变化，重新生成编码方式
+                    for key in [key for key in self._model_encoders if key[0] == model.TABLE_NAME]:
+                        del self._model_encoders[key]
+
+                    # 获取表结构,field -> SqliteType
+                    model_schema = self._model_schema.get(type(model))
+                    if model_schema is None:
+                        new_structure, foreign_tables = {}, {}
+                        for n_field, n_value in model.dump(by_alias=True).items():
+                            if n_field not in ["TABLE_NAME", "id"]:
+                                stored_field = check_sqlite_identifier(self._get_stored_field_prefix(n_value) + n_field)
+                                new_structure[stored_field] = self._get_stored_type(n_value)
+                                if isinstance(n_value, dict) and "TABLE_NAME" in n_value:
+                                    foreign_tables[stored_field] = check_sqlite_identifier(n_value["TABLE_NAME"])
+                        model_schema = self._model_schema[type(model)] = (new_structure, foreign_tables)
+                    new_structure, foreign_tables = model_schema
+                    self._model_constructors.pop(type(model), None)
+                    # 已有的外键列可能是旧版本创建的，没有REFERENCES，迁移后按实际表结构重新读取
+                    self._foreign_tables.pop(model.TABLE_NAME, None)
+                    for key in [key for key in self._table_columns if key[0] == model.TABLE_NAME]:
+                        del self._table_columns[key]
+
+                    # 原有的字段列表
+                    existing_structure = self._table_structure.get(model.TABLE_NAME)
+                    if existing_structure is None:
+                        existing_structure = dict([(column[1], column[2]) for column in cursor.execute(f'PRAGMA table_info({model.TABLE_NAME})').fetchall()])
+                    if existing_structure.keys() - {"id"} == new_structure.keys():
+                        # 表结构未变化
+                        self._table_structure[model.TABLE_NAME] = existing_structure
+                        self._table_exists.add(model.TABLE_NAME)
+                        self._create_indexes(cursor, model)
+                        continue
+                    # 检测缺失字段，由于SQLite是动态类型，所以不需要检测类型
+                    for n_field, n_type in new_structure.items():
+                        if n_field not in existing_structure.keys() and n_field.lower() not in ["id", "table_name"]:
+                            # 带默认值添加字段，SQLite会直接回填已有行，无需额外UPDATE
+                            if n_field in foreign_tables:
+                                # 外键列引用目标表的id，默认值为NULL以免指向不存在的数据
+                                n_type, default_value = f"{n_type} REFERENCES {foreign_tables[n_field]}(id)", "NULL"
+                            else:
+                                default_value = self.DEFAULT_MAPPING.get(n_type, "NULL")
+                            cursor.execute(
+                                f"ALTER TABLE '{model.TABLE_NAME}' ADD COLUMN {n_field} {n_type} DEFAULT {default_value}"
+                            )
+
+                    # 检测多余字段进行删除
+                    for e_field in existing_structure.keys():
+                        if e_field not in new_structure.keys() and e_field.lower() not in ['id']:
+                            # 被索引的列无法直接删除，先删除相关索引
+                            for index in cursor.execute(f'PRAGMA index_list("{model.TABLE_NAME}")').fetchall():
+                                if e_field in [column[2] for column in cursor.execute(f'PRAGMA index_info("{index[1]}")').fetchall()]:
+                                    cursor.execute(f'DROP INDEX IF EXISTS "{index[1]}"')
+                            cursor.execute(
+                                f'ALTER TABLE "{model.TABLE_NAME}" DROP COLUMN "{e_field}"'
+                            )
+                    # 记录实际的列类型，保留的列不会随字段类型变化而改变
+                    self._table_structure[model.TABLE_NAME] = {
+                            "id": existing_structure.get("id", "INTEGER"),
+                            **{n_field: existing_structure.get(n_field, n_type) for n_field, n_type in new_structure.items()}
+                    }
+                    self._table_exists.add(model.TABLE_NAME)
+                    self._create_indexes(cursor, model)
+            except Exception:
+                conn.rollback()
+                self._table_structure.clear()
+                self._table_exists.clear()
+                self._foreign_tables.clear()
+                self._table_columns.clear()
+                self._model_constructors.clear()
+                raise
+            conn.commit()
         # 已完成
 
+    def _create_indexes(self, cursor: sqlite3.Cursor, model: LiteModel):
+        """根据模型的__indexes__创建索引
+        Args:
+            cursor: 写连接游标
+            model: 数据模型实例
+        """
+        for index_fields in model.__indexes__:
+            columns = [self._get_stored_field(model.TABLE_NAME, field) for field in index_fields]
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS "ix_{model.TABLE_NAME}_{"_".join(columns)}" ON "{model.TABLE_NAME}" ({", ".join(columns)})'
+            )
+
+    def _get_stored_field(self, table_name: str, field: str) -> str:
+        """获取模型字段在表中对应的列名
+        Args:
+            table_name: 表名
+            field: 模型字段名
+
+        Returns:
+            列名
+        """
+        check_sqlite_identifier(field)
+        structure = self._table_structure.get(table_name)
+        if structure is None:
+            # 未在本实例中迁移的表，从PRAGMA table_info中读取
+            check_sqlite_identifier(table_name)
+            with self.pool.reader() as conn:
+                structure = {column[1]: column[2] for column in conn.execute(f"PRAGMA table_info({table_name})").fetchall()}
+            if not structure:
+                return field
+            self._table_structure[table_name] = structure
+        if field in structure:
+            return field
+        for prefix in (self.FOREIGN_KEY_PREFIX, self.BYTES_PREFIX):
+            if prefix + field in structure:
+                return prefix + field
+        raise ValueError(f"表 {table_name} 中不存在字段 {field}")
+
     def _get_stored_field_prefix(self, value) -> str:
         """根据类型获取存储字段前缀，一定在后加上字段名
         * -> ""
@@ -284,22 +1129,6 @@ class Database:
             return "INTEGER"
         return self.TYPE_MAPPING.get(type(value), "TEXT")
 
-    def _get_foreign_data(self, foreign_value: str) -> dict:
-        """
-        获取外键数据
-        Args:
-            foreign_value:
-
-        Returns:
-
-        """
-        foreign_value = foreign_value.replace(self.FOREIGN_KEY_PREFIX, "")
-        table_name = foreign_value.split("@")[-1]
-        foreign_id = foreign_value.split("@")[0]
-        fields = [description[1] for description in self.cursor.execute(f"PRAGMA table_info({table_name})").fetchall()]
-        result = self.cursor.execute(f"SELECT * FROM {table_name} WHERE id = ?", (foreign_id,)).fetchone()
-        return dict(zip(fields, result))
-
     TYPE_MAPPING = {
             int      : "INTEGER",
             float    : "REAL",
@@ -322,20 +1151,49 @@ class Database:
             "TEXT"   : "''",
             "INTEGER": 0,
             "REAL"   : 0.0,
-            "BLOB"   : None,
-            "NULL"   : None
+            "BLOB"   : "NULL",
+            "NULL"   : "NULL"
     }
 
     # 基础类型
     BASIC_TYPE = (int, float, str, bool, bytes, NoneType)
+    BASIC_TYPE_SET = frozenset(BASIC_TYPE)
     # 可序列化类型
     ITERABLE_TYPE = (dict, list, tuple, set, LiteModel)
 
+    # 读出后类型不变的列类型 -> 字段类型
+    TRUSTED_COLUMN_TYPES = {
+            "INTEGER": (int,),
+            "REAL"   : (float,),
+            "TEXT"   : (str,),
+            "BLOB"   : (bytes,),
+    }
+    # 序列化后类型不变的容器类型，元素类型需不受限
+    TRUSTED_CONTAINER_TYPES = (dict, list)
+
     # 外键前缀
     FOREIGN_KEY_PREFIX = "FOREIGN_KEY_"
     # 转换为的字节前缀
     BYTES_PREFIX = "PICKLE_BYTES_"
 
+    # 存储前缀的首字符
+    PREFIX_INITIALS = frozenset((FOREIGN_KEY_PREFIX[0], BYTES_PREFIX[0]))
+
+    # pickle协议版本
+    PICKLE_PROTOCOL = pickle.HIGHEST_PROTOCOL
+
+    # 逐批查询时每批读取的行数
+    ITER_BATCH_SIZE = 256
+
+    # 同一批写入超过该行数时使用多行VALUES语句
+    MULTI_ROW_THRESHOLD = 20
+
+    # 单条语句的参数数量上限，SQLite默认限制为999
+    MAX_QUERY_PARAMS = 900
+
+
+SQLITE_IDENTIFIER_PATTERN = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+
 
 def check_sqlite_keyword(name):
     sqlite_keywords = [
@@ -358,3 +1216,16 @@ def check_sqlite_keyword(name):
     return True
     # if name.upper() in sqlite_keywords:
     #     raise ValueError(f"'{name}' 是SQLite保留字，不建议使用，请更换名称")
+
+
+def check_sqlite_identifier(name: str) -> str:
+    """检查表名/字段名是否为合法标识符，防止拼接SQL时注入
+    Args:
+        name: 表名或字段名
+
+    Returns:
+        原名称
+    """
+    if not isinstance(name, str) or not SQLITE_IDENTIFIER_PATTERN.fullmatch(name):
+        raise ValueError(f"'{name}' 不是合法的SQLite标识符，仅允许字母、数字和下划线且不能以数字开头")
+    return name
@@ -14,6 +14,7 @@ common_db = DB(os.path.join(DATA_PATH, "common.ldb"))
 
 class User(LiteModel):
     TABLE_NAME = "user"
+    __indexes__ = [("user_id",)]
     user_id: str = Field(str(), alias="user_id")
     username: str = Field(str(), alias="username")
     profile: dict[str, str] = Field(dict(), alias="profile")
@@ -23,6 +24,7 @@ class User(LiteModel):
 
 class Group(LiteModel):
     TABLE_NAME = "group_chat"
+    __indexes__ = [("group_id",)]
     # Group是一个关键字，所以这里用GroupChat
     group_id: str = Field(str(), alias="group_id")
     group_name: str = Field(str(), alias="group_name")
@@ -32,12 +34,14 @@ class Group(LiteModel):
 
 class InstalledPlugin(LiteModel):
     TABLE_NAME = "installed_plugin"
+    __indexes__ = [("module_name",)]
     module_name: str = Field(str(), alias="module_name")
     version: str = Field(str(), alias="version")
 
 
 class GlobalPlugin(LiteModel):
     TABLE_NAME = "global_plugin"
+    __indexes__ = [("module_name",)]
     liteyuki: bool = Field(True, alias="liteyuki")  # 是否为LiteYuki插件
     module_name: str = Field(str(), alias="module_name")
     enabled: bool = Field(True, alias="enabled")